@@ -1,20 +1,33 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Depends, File, UploadFile, Form, Body, Query
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, File, UploadFile, Form, Body, Query, BackgroundTasks
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from fastapi.middleware.cors import CORSMiddleware
-from motor.motor_asyncio import AsyncIOMotorClient
+from fastapi.responses import ORJSONResponse, Response, StreamingResponse
+from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorGridFSBucket
+from gridfs.errors import FileExists, NoFile
+from pymongo.errors import DuplicateKeyError, OperationFailure
 from pydantic import BaseModel, Field, EmailStr
 from typing import List, Optional, Dict, Any
 from datetime import datetime, timedelta
-from passlib.context import CryptContext
-from jose import JWTError, jwt
-from geopy.distance import geodesic
+from argon2 import PasswordHasher
+from argon2.exceptions import InvalidHashError, VerificationError
+import bcrypt
+from jose import JWTError, jwt, jws, jwk
+from jose.exceptions import JOSEError
+from cachetools import TTLCache
+from concurrent.futures import ThreadPoolExecutor
 import os
+import asyncio
 import logging
 import uuid
-import base64
+import time
+import json
 from pathlib import Path
 import io
+import orjson
 from PIL import Image
+import numpy as np
+import cv2
+from turbojpeg import TurboJPEG, TJSAMP_420
 
 # Environment setup
 ROOT_DIR = Path(__file__).parent
@@ -23,8 +36,14 @@ load_dotenv(ROOT_DIR / '.env')
 
 # MongoDB connection
 mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
+client = AsyncIOMotorClient(
+    mongo_url,
+    maxPoolSize=int(os.environ.get('MONGO_MAX_POOL_SIZE', 200)),
+    minPoolSize=int(os.environ.get('MONGO_MIN_POOL_SIZE', 20)),
+)
 db = client[os.environ.get('DB_NAME', 'door_discovery_db')]
+# Door images are stored in GridFS, keyed by door id
+fs = AsyncIOMotorGridFSBucket(db, bucket_name="door_images")
 
 # Create the main app without a prefix
 app = FastAPI(title="Door Discovery API")
@@ -36,13 +55,20 @@ api_router = APIRouter(prefix="/api")
 SECRET_KEY = os.environ.get("SECRET_KEY", "thisisasecretkey12345")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24 * 7  # 7 days
+# Built once so token verification doesn't reconstruct the HMAC key on every request
+SIGNING_KEY = jwk.construct(SECRET_KEY, ALGORITHM)
 
-# Password hashing
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Password hashing: new hashes use argon2id; existing bcrypt hashes still verify and
+# are upgraded on the user's next login. Both go straight to the C extensions.
+password_hasher = PasswordHasher(time_cost=2, memory_cost=19456, parallelism=1)
 
 # OAuth2 bearer token
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/token")
 
+# Short-lived caches for get_current_user: decoded token payloads and the users they resolve to
+token_cache = TTLCache(maxsize=10_000, ttl=15)
+user_cache = TTLCache(maxsize=10_000, ttl=15)
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -50,6 +76,50 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Documents fetched per round-trip when streaming cursors
+MONGO_BATCH_SIZE = 100
+
+# Mongo-only fields left out of door documents returned by the API
+DOOR_PROJECTION = {"_id": 0, "geo": 0}
+
+# Image processing: each upload is kept as-is and rendered to a full-size and a thumbnail JPEG
+IMAGE_WIDTH = 800
+THUMB_WIDTH = 200
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+# Upload formats accepted, by the format Pillow detects (never the client's Content-Type)
+UPLOAD_CONTENT_TYPES = {
+    "JPEG": "image/jpeg",
+    "PNG": "image/png",
+    "GIF": "image/gif",
+    "WEBP": "image/webp",
+    "BMP": "image/bmp",
+}
+MAX_IMAGE_BYTES = int(os.environ.get("MAX_IMAGE_BYTES", 20 * 1024 * 1024))
+JPEG_QUALITY = 85
+# DCT-domain scales libjpeg can decode at, smallest first
+JPEG_SCALING_FACTORS = [(1, 8), (1, 4), (1, 2), (1, 1)]
+# cv2.imdecode flags giving the same DCT-domain scales, by denominator. Orientation is
+# ignored so both decode paths produce the same raster as libjpeg-turbo.
+CV2_JPEG_SCALE_FLAGS = {
+    1: cv2.IMREAD_COLOR,
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    8: cv2.IMREAD_REDUCED_COLOR_8,
+}
+# What resize_image raises for an upload that is broken rather than a transient failure
+IMAGE_DECODE_ERRORS = (OSError, ValueError, cv2.error, Image.DecompressionBombError)
+
+# Door notifications go to users whose home is within 25 miles
+NOTIFICATION_RADIUS_KM = 40.2336
+EARTH_RADIUS_KM = 6371.0
+
+# libjpeg-turbo codec; uploads are decoded/encoded through it when available
+try:
+    tj = TurboJPEG()
+except (OSError, RuntimeError):
+    logger.warning("libturbojpeg not found, falling back to Pillow/OpenCV for JPEG I/O")
+    tj = None
+
 # Define Models
 class Token(BaseModel):
     access_token: str
@@ -58,9 +128,15 @@ class Token(BaseModel):
 class TokenData(BaseModel):
     email: Optional[str] = None
 
+class Location(BaseModel):
+    # Bounded so out-of-range points fail validation instead of the 2dsphere index write
+    latitude: float = Field(ge=-90, le=90)
+    longitude: float = Field(ge=-180, le=180)
+
 class UserBase(BaseModel):
     email: EmailStr
     name: str
+    home_location: Optional[Location] = None
 
 class UserCreate(UserBase):
     password: str
@@ -72,10 +148,6 @@ class User(UserBase):
 class UserInDB(User):
     hashed_password: str
 
-class Location(BaseModel):
-    latitude: float
-    longitude: float
-
 class DoorBase(BaseModel):
     title: str
     description: str
@@ -92,8 +164,17 @@ class Door(DoorBase):
     user_id: str
     user_name: str
     image_url: str
+    image_thumb_url: Optional[str] = None
     created_at: datetime = Field(default_factory=datetime.utcnow)
 
+class DoorSummary(DoorBase):
+    """Door as returned by list endpoints, which only carry the thumbnail."""
+    id: str
+    user_id: str
+    user_name: str
+    image_thumb_url: str
+    created_at: datetime
+
 class CommentBase(BaseModel):
     text: str
 
@@ -119,11 +200,97 @@ class Notification(NotificationBase):
     created_at: datetime = Field(default_factory=datetime.utcnow)
 
 # Helper functions
-def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
-
-def get_password_hash(password):
-    return pwd_context.hash(password)
+def verify_and_update_password(plain_password, hashed_password):
+    """Returns (valid, new_hash); new_hash is set when the stored hash needs upgrading."""
+    if hashed_password.startswith("$2"):
+        # Legacy bcrypt hash; bcrypt only ever saw the first 72 bytes of the password
+        try:
+            valid = bcrypt.checkpw(plain_password.encode()[:72], hashed_password.encode())
+        except ValueError:
+            valid = False
+        return valid, password_hasher.hash(plain_password) if valid else None
+    
+    try:
+        password_hasher.verify(hashed_password, plain_password)
+    except (VerificationError, InvalidHashError):
+        return False, None
+    if password_hasher.check_needs_rehash(hashed_password):
+        return True, password_hasher.hash(plain_password)
+    return True, None
+
+# Password hashing is deliberately slow; run it in the thread pool so it doesn't block the event loop
+async def verify_password(plain_password, hashed_password):
+    return await asyncio.to_thread(verify_and_update_password, plain_password, hashed_password)
+
+async def get_password_hash(password):
+    return await asyncio.to_thread(password_hasher.hash, password)
+
+def jpeg_scaling_factor(width: int, target_width: int):
+    """Pick the smallest DCT scale that still decodes at least target_width pixels wide."""
+    for num, denom in JPEG_SCALING_FACTORS:
+        if -(-width * num // denom) >= target_width:
+            return (num, denom)
+    return (1, 1)
+
+def resize_image(image_content: bytes, widths) -> List[bytes]:
+    """Decode an uploaded image once and re-encode it as a JPEG at each of the given widths."""
+    target_width = max(widths)
+    is_jpeg = image_content[:2] == b"\xff\xd8"
+    if tj is not None and is_jpeg:
+        width, _, _, _ = tj.decode_header(image_content)
+        img = tj.decode(image_content, scaling_factor=jpeg_scaling_factor(width, target_width))
+    else:
+        # Non-JPEG upload (or no libturbojpeg): decode with OpenCV. For JPEGs the
+        # IMREAD_REDUCED_* flags get the same scaled IDCT out of libjpeg.
+        flags = cv2.IMREAD_COLOR
+        if is_jpeg:
+            width, _ = Image.open(io.BytesIO(image_content)).size
+            _, denom = jpeg_scaling_factor(width, target_width)
+            flags = CV2_JPEG_SCALE_FLAGS[denom]
+        img = cv2.imdecode(np.frombuffer(image_content, np.uint8), flags | cv2.IMREAD_IGNORE_ORIENTATION)
+        if img is None:
+            # Formats OpenCV has no codec for (e.g. GIF) still go through Pillow
+            img = Image.open(io.BytesIO(image_content)).convert("RGB")
+            img = cv2.cvtColor(np.asarray(img), cv2.COLOR_RGB2BGR)
+    
+    jpegs = []
+    for width in widths:
+        height = max(1, int(width * img.shape[0] / img.shape[1]))
+        resized = cv2.resize(img, (width, height), interpolation=cv2.INTER_AREA)
+        if tj is not None:
+            jpegs.append(tj.encode(resized, quality=JPEG_QUALITY, jpeg_subsample=TJSAMP_420))
+            continue
+        ok, buf = cv2.imencode(
+            ".jpg", resized, [cv2.IMWRITE_JPEG_QUALITY, JPEG_QUALITY, cv2.IMWRITE_JPEG_OPTIMIZE, 1]
+        )
+        if not ok:
+            raise ValueError("JPEG encoding failed")
+        jpegs.append(buf.tobytes())
+    return jpegs
+
+def geo_point(location: Location) -> dict:
+    """GeoJSON point for a Location, stored alongside documents for the 2dsphere indexes."""
+    return {"type": "Point", "coordinates": [location.longitude, location.latitude]}
+
+def json_default(value):
+    """orjson fallback for BSON values it can't encode natively (ObjectId, Decimal128, ...)."""
+    return str(value)
+
+class MongoJSONResponse(ORJSONResponse):
+    """Renders raw Mongo documents without building Pydantic models first."""
+    def render(self, content) -> bytes:
+        return orjson.dumps(content, default=json_default)
+
+async def stream_json_array(cursor):
+    """Serialize a Mongo cursor as a JSON array, one document at a time."""
+    yield b"["
+    first = True
+    async for document in cursor:
+        if not first:
+            yield b","
+        yield orjson.dumps(document, default=json_default)
+        first = False
+    yield b"]"
 
 async def get_user_by_email(email: str):
     user = await db.users.find_one({"email": email})
@@ -135,8 +302,11 @@ async def authenticate_user(email: str, password: str):
     user = await get_user_by_email(email)
     if not user:
         return False
-    if not verify_password(password, user.hashed_password):
+    valid, new_hash = await verify_password(password, user.hashed_password)
+    if not valid:
         return False
+    if new_hash:
+        await db.users.update_one({"id": user.id}, {"$set": {"hashed_password": new_hash}})
     return user
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
@@ -149,23 +319,38 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
+def decode_access_token(token: str) -> dict:
+    """Verify an access token's signature and expiry and return its claims."""
+    payload = json.loads(jws.verify(token, SIGNING_KEY, algorithms=[ALGORITHM]))
+    exp = payload.get("exp")
+    if not isinstance(exp, (int, float)) or exp <= time.time():
+        raise JWTError("Signature has expired")
+    return payload
+
 async def get_current_user(token: str = Depends(oauth2_scheme)):
     credentials_exception = HTTPException(
         status_code=401,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        email: str = payload.get("sub")
-        if email is None:
+    payload = token_cache.get(token)
+    if payload is None or payload["exp"] <= time.time():
+        try:
+            payload = decode_access_token(token)
+        except (JOSEError, ValueError):
             raise credentials_exception
-        token_data = TokenData(email=email)
-    except JWTError:
+        token_cache[token] = payload
+    email: str = payload.get("sub")
+    if email is None:
         raise credentials_exception
-    user = await get_user_by_email(email=token_data.email)
+    token_data = TokenData(email=email)
+    
+    user = user_cache.get(token_data.email)
     if user is None:
-        raise credentials_exception
+        user = await get_user_by_email(email=token_data.email)
+        if user is None:
+            raise credentials_exception
+        user_cache[token_data.email] = user
     return user
 
 # Auth routes
@@ -178,17 +363,27 @@ async def register_user(user: UserCreate):
             detail="Email already registered"
         )
     
-    hashed_password = get_password_hash(user.password)
-    user_dict = user.dict(exclude={"password"})
+    hashed_password = await get_password_hash(user.password)
+    user_dict = user.model_dump(exclude={"password"})
     user_dict["id"] = str(uuid.uuid4())
     user_in_db = UserInDB(
         **user_dict,
         hashed_password=hashed_password
     )
     
-    await db.users.insert_one(user_in_db.dict())
+    user_doc = user_in_db.model_dump()
+    if user_in_db.home_location:
+        user_doc["geo"] = geo_point(user_in_db.home_location)
+    try:
+        await db.users.insert_one(user_doc)
+    except DuplicateKeyError:
+        # Lost a race with a concurrent registration for the same email
+        raise HTTPException(
+            status_code=400,
+            detail="Email already registered"
+        )
     
-    return User(**user_in_db.dict(exclude={"hashed_password"}))
+    return User(**user_in_db.model_dump(exclude={"hashed_password"}))
 
 @api_router.post("/token")
 async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends()):
@@ -212,13 +407,14 @@ async def read_users_me(current_user: User = Depends(get_current_user)):
 # Door routes
 @api_router.post("/doors", response_model=Door)
 async def create_door(
+    background_tasks: BackgroundTasks,
     title: str = Form(...),
     description: str = Form(...),
     place_name: str = Form(None),
     history: str = Form(None),
     category: str = Form(...),
-    latitude: float = Form(...),
-    longitude: float = Form(...),
+    latitude: float = Form(..., ge=-90, le=90),
+    longitude: float = Form(..., ge=-180, le=180),
     image: UploadFile = File(...),
     current_user: User = Depends(get_current_user)
 ):
@@ -226,19 +422,31 @@ async def create_door(
     if category not in ["A", "B"]:
         raise HTTPException(status_code=400, detail="Category must be either 'A' or 'B'")
     
-    # Save image as base64
-    image_content = await image.read()
+    if image.size is not None and image.size > MAX_IMAGE_BYTES:
+        raise HTTPException(status_code=413, detail="Image too large")
+    
+    # Only read the header here; resizing happens after the response is sent
     try:
-        img = Image.open(io.BytesIO(image_content))
-        img = img.resize((800, int(800 * img.height / img.width)))
-        output = io.BytesIO()
-        img.save(output, format="JPEG")
-        image_base64 = base64.b64encode(output.getvalue()).decode("utf-8")
+        image_format = Image.open(image.file).format
+        image.file.seek(0)
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Invalid image: {str(e)}")
+    if image_format not in UPLOAD_CONTENT_TYPES:
+        raise HTTPException(status_code=400, detail=f"Unsupported image format: {image_format}")
+    
+    # Store the upload in GridFS as-is; it is never served, only re-encoded into the
+    # variants keyed by the door's id
+    door_id = str(uuid.uuid4())
+    await fs.upload_from_stream_with_id(
+        f"{door_id}/original",
+        image.filename or door_id,
+        image.file,
+        metadata={"contentType": UPLOAD_CONTENT_TYPES[image_format]}
+    )
     
     # Create door
     door = Door(
+        id=door_id,
         title=title,
         description=description,
         place_name=place_name,
@@ -247,38 +455,94 @@ async def create_door(
         location=Location(latitude=latitude, longitude=longitude),
         user_id=current_user.id,
         user_name=current_user.name,
-        image_url=f"data:image/jpeg;base64,{image_base64}"
+        image_url=f"/api/doors/{door_id}/image",
+        image_thumb_url=f"/api/doors/{door_id}/thumb"
     )
     
-    await db.doors.insert_one(door.dict())
+    door_doc = door.model_dump()
+    door_doc["geo"] = geo_point(door.location)
+    await db.doors.insert_one(door_doc)
     
-    # Create notifications for users within 25 miles
-    await create_notifications_for_nearby_users(door)
+    # Once the response has been sent, render the image variants and create
+    # notifications for users within 25 miles
+    background_tasks.add_task(publish_door, door)
     
     return door
 
-async def create_notifications_for_nearby_users(door: Door):
-    door_location = (door.location.latitude, door.location.longitude)
+async def render_variants(door_id: str, widths) -> Optional[List[bytes]]:
+    """Re-encode a door's original upload at the given widths.
     
-    # Get all users
-    users = await db.users.find().to_list(1000)
+    Returns None, after removing the door, when the upload turns out to be undecodable:
+    the header check in create_door passed, but the image itself is broken."""
+    grid_out = await fs.open_download_stream(f"{door_id}/original")
+    original = await grid_out.read()
+    try:
+        return await asyncio.to_thread(resize_image, original, widths)
+    except IMAGE_DECODE_ERRORS:
+        logger.exception("Removing door %s: its image could not be decoded", door_id)
+        await db.doors.delete_one({"id": door_id})
+        await db.comments.delete_many({"door_id": door_id})
+        await db.notifications.delete_many({"door_id": door_id})
+        try:
+            await fs.delete(f"{door_id}/original")
+        except NoFile:
+            pass
+        return None
+
+async def store_variant(file_id: str, jpeg: bytes):
+    """Write a rendered variant to GridFS; a concurrent render may already have stored it."""
+    try:
+        await fs.upload_from_stream_with_id(
+            file_id, f"{file_id.replace('/', '_')}.jpg", jpeg, metadata={"contentType": "image/jpeg"}
+        )
+    except FileExists:
+        pass
+
+async def publish_door(door: Door):
+    """Render a new door's image variants, then notify nearby users about it."""
+    variants = await render_variants(door.id, (IMAGE_WIDTH, THUMB_WIDTH))
+    if variants is None:
+        return
+    image, thumb = variants
+    await store_variant(door.id, image)
+    await store_variant(f"{door.id}/thumb", thumb)
+    await create_notifications_for_nearby_users(door)
+
+async def create_notifications_for_nearby_users(door: Door):
+    # Get all users except the door creator whose home is nearby; the 2dsphere index on
+    # users.geo does the distance filter. Users without a home location keep getting
+    # every notification.
+    radius = NOTIFICATION_RADIUS_KM / EARTH_RADIUS_KM
+    users = db.users.find(
+        {
+            "id": {"$ne": door.user_id},
+            "$or": [
+                {"geo": {"$geoWithin": {"$centerSphere": [
+                    [door.location.longitude, door.location.latitude], radius
+                ]}}},
+                {"home_location": None},
+            ],
+        },
+        {"id": 1, "_id": 0}
+    ).batch_size(MONGO_BATCH_SIZE)
     
-    for user in users:
-        # Skip the door creator
-        if user["id"] == door.user_id:
-            continue
-        
-        # Create notification for all users (in a real app, you'd check for user location)
-        notification = Notification(
+    # Insert as users stream in, so memory stays bounded by one batch
+    notifications = []
+    async for user in users:
+        notifications.append(Notification(
             title=f"New {door.category} Door Discovered!",
             message=f"{door.user_name} discovered a door: {door.title}",
             door_id=door.id,
             user_id=user["id"]
-        )
-        
-        await db.notifications.insert_one(notification.dict())
+        ).model_dump())
+        if len(notifications) >= MONGO_BATCH_SIZE:
+            await db.notifications.insert_many(notifications, ordered=False)
+            notifications = []
+    
+    if notifications:
+        await db.notifications.insert_many(notifications, ordered=False)
 
-@api_router.get("/doors", response_model=List[Door])
+@api_router.get("/doors", response_model=List[DoorSummary])
 async def get_doors(
     category: Optional[str] = Query(None),
     current_user: User = Depends(get_current_user)
@@ -287,15 +551,61 @@ async def get_doors(
     if category:
         query["category"] = category
     
-    doors = await db.doors.find(query).to_list(1000)
-    return [Door(**door) for door in doors]
+    # Documents are written from validated models, so stream them out as-is
+    # rather than buffering and re-validating each one through response_model.
+    # Lists only carry the thumbnail; doors from before thumbnails fall back to image_url.
+    doors = db.doors.aggregate([
+        {"$match": query},
+        {"$limit": 1000},
+        {"$set": {"image_thumb_url": {"$ifNull": ["$image_thumb_url", "$image_url"]}}},
+        {"$project": {**DOOR_PROJECTION, "image_url": 0}},
+    ], batchSize=MONGO_BATCH_SIZE)
+    return StreamingResponse(stream_json_array(doors), media_type="application/json")
 
 @api_router.get("/doors/{door_id}", response_model=Door)
 async def get_door(door_id: str, current_user: User = Depends(get_current_user)):
-    door = await db.doors.find_one({"id": door_id})
+    door = await db.doors.find_one({"id": door_id}, DOOR_PROJECTION)
     if not door:
         raise HTTPException(status_code=404, detail="Door not found")
-    return Door(**door)
+    return MongoJSONResponse(door)
+
+async def stream_door_image(door_id: str, file_id: str, width: int):
+    """Stream an image variant from GridFS, rendering and storing it first if it is missing."""
+    headers = {"X-Content-Type-Options": "nosniff", "Cache-Control": IMMUTABLE_CACHE_CONTROL}
+    try:
+        grid_out = await fs.open_download_stream(file_id)
+    except NoFile:
+        # The background render hasn't run yet (or never will, if its worker died).
+        # Re-encode rather than serve the upload, so clients only ever get a JPEG we
+        # produced, stripped of EXIF metadata, and keep it so this happens once.
+        try:
+            variants = await render_variants(door_id, (width,))
+        except NoFile:
+            variants = None
+        if variants is None:
+            raise HTTPException(status_code=404, detail="Image not found")
+        jpeg, = variants
+        await store_variant(file_id, jpeg)
+        return Response(jpeg, media_type="image/jpeg", headers=headers)
+    
+    async def chunks():
+        while chunk := await grid_out.readchunk():
+            yield chunk
+    
+    return StreamingResponse(
+        chunks(),
+        media_type="image/jpeg",
+        headers={**headers, "Content-Length": str(grid_out.length)},
+    )
+
+# Not authenticated: the URLs are used directly as <img> srcs
+@api_router.get("/doors/{door_id}/image")
+async def get_door_image(door_id: str):
+    return await stream_door_image(door_id, door_id, IMAGE_WIDTH)
+
+@api_router.get("/doors/{door_id}/thumb")
+async def get_door_thumb(door_id: str):
+    return await stream_door_image(door_id, f"{door_id}/thumb", THUMB_WIDTH)
 
 # Comment routes
 @api_router.post("/comments", response_model=Comment)
@@ -309,12 +619,12 @@ async def create_comment(
         raise HTTPException(status_code=404, detail="Door not found")
     
     new_comment = Comment(
-        **comment.dict(),
+        **comment.model_dump(),
         user_id=current_user.id,
         user_name=current_user.name
     )
     
-    await db.comments.insert_one(new_comment.dict())
+    await db.comments.insert_one(new_comment.model_dump())
     
     return new_comment
 
@@ -323,17 +633,19 @@ async def get_comments(
     door_id: str,
     current_user: User = Depends(get_current_user)
 ):
-    comments = await db.comments.find({"door_id": door_id}).to_list(1000)
-    return [Comment(**comment) for comment in comments]
+    comments = db.comments.find(
+        {"door_id": door_id}, {"_id": 0}
+    ).sort("created_at", 1).limit(1000).batch_size(MONGO_BATCH_SIZE)
+    return StreamingResponse(stream_json_array(comments), media_type="application/json")
 
 # Notification routes
 @api_router.get("/notifications", response_model=List[Notification])
 async def get_notifications(current_user: User = Depends(get_current_user)):
-    notifications = await db.notifications.find(
-        {"user_id": current_user.id}
-    ).sort("created_at", -1).to_list(100)
+    notifications = db.notifications.find(
+        {"user_id": current_user.id}, {"_id": 0}
+    ).sort("created_at", -1).limit(100)
     
-    return [Notification(**notification) for notification in notifications]
+    return StreamingResponse(stream_json_array(notifications), media_type="application/json")
 
 @api_router.post("/notifications/{notification_id}/read")
 async def mark_notification_as_read(
@@ -367,6 +679,59 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.on_event("startup")
+async def configure_thread_pool():
+    # Sized for the CPU-bound work (password hashing) offloaded via asyncio.to_thread
+    asyncio.get_running_loop().set_default_executor(
+        ThreadPoolExecutor(max_workers=(os.cpu_count() or 1) * 2)
+    )
+
+# MongoDB error codes create_unique_index expects when several workers start at once
+INDEX_NOT_FOUND = 27
+INDEX_CONFLICT_CODES = (85, 86)  # IndexOptionsConflict, IndexKeySpecsConflict
+
+async def create_unique_index(collection, field: str):
+    """Create a unique index on field, replacing an older non-unique index of the same name.
+    
+    Runs in every worker's startup, so each step tolerates another worker having done it first."""
+    name = f"{field}_1"
+    existing = (await collection.index_information()).get(name)
+    if existing and not existing.get("unique"):
+        try:
+            await collection.drop_index(name)
+        except OperationFailure as e:
+            if e.code != INDEX_NOT_FOUND:
+                raise
+    try:
+        await collection.create_index(field, unique=True, name=name)
+    except DuplicateKeyError:
+        # Registration used to be check-then-insert, so older databases can hold duplicates.
+        # Keep serving on a plain index; dedupe_users.py merges duplicate accounts.
+        logger.error(
+            "Duplicate %s.%s values prevent the unique index; run dedupe_users.py and restart",
+            collection.name, field
+        )
+        await collection.create_index(field, name=name)
+    except OperationFailure as e:
+        # Another worker hit the duplicates first and already built the plain index
+        if e.code not in INDEX_CONFLICT_CODES:
+            raise
+
+@app.on_event("startup")
+async def create_indexes():
+    # One index per query pattern; compound indexes also serve the sorts
+    await create_unique_index(db.users, "email")
+    await create_unique_index(db.users, "id")
+    await db.users.create_index([("geo", "2dsphere")])
+    # Lets the no-home-location branch of the nearby-users query use an index too
+    await db.users.create_index("home_location")
+    await create_unique_index(db.doors, "id")
+    await db.doors.create_index("category")
+    await db.doors.create_index([("geo", "2dsphere")])
+    await db.comments.create_index([("door_id", 1), ("created_at", -1)])
+    await db.notifications.create_index([("user_id", 1), ("created_at", -1)])
+    await db.notifications.create_index([("id", 1), ("user_id", 1)])
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
     client.close()
@@ -1,17 +1,43 @@
-import requests
+import httpx
 import sys
 import time
 import random
 import string
 import base64
-from datetime import datetime
+import json
+from datetime import datetime, timedelta
 from PIL import Image
 import io
 import os
+import uuid
+import bcrypt
+from argon2 import PasswordHasher
+from jose import jwt
+from pymongo import MongoClient
+from dotenv import load_dotenv
+
+# Backend settings, for the tests that seed users straight into the database or sign tokens
+load_dotenv('/app/backend/.env')
+SECRET_KEY = os.environ.get("SECRET_KEY", "thisisasecretkey12345")
+
+# New password hashes use argon2id with these parameters (see password_hasher in backend/server.py)
+CURRENT_ARGON2_PREFIX = "$argon2id$v=19$m=19456,t=2,p=1$"
+
+def make_test_jpeg():
+    """Encode a plain red JPEG, wider than the 800px the server downscales to"""
+    img = Image.new('RGB', (1600, 1200), color='red')
+    img_byte_arr = io.BytesIO()
+    img.save(img_byte_arr, format='JPEG', quality=85, subsampling=2)
+    return img_byte_arr.getvalue()
 
 class DoorDiscoveryAPITester:
+    # The fixture is deterministic, so encode it once rather than on every upload
+    _RED_JPEG = make_test_jpeg()
+
     def __init__(self, base_url):
         self.base_url = base_url
+        # One keep-alive (HTTP/2) connection shared by every test call
+        self.client = httpx.Client(base_url=f"{base_url}/api", http2=True, timeout=10.0)
         self.token = None
         self.tests_run = 0
         self.tests_passed = 0
@@ -19,12 +45,16 @@ class DoorDiscoveryAPITester:
         self.user_password = "TestPassword123!"
         self.user_name = f"Test User {int(time.time())}"
         self.test_door_id = None
+        self.test_door_image_urls = {}
         self.test_notification_id = None
         self.test_comment_id = None
+        # Seeding needs the backend's database; those tests are skipped without MONGO_URL
+        mongo_url = os.environ.get('MONGO_URL')
+        self.mongo = MongoClient(mongo_url) if mongo_url else None
+        self.db = self.mongo[os.environ.get('DB_NAME', 'door_discovery_db')] if self.mongo else None
 
     def run_test(self, name, method, endpoint, expected_status, data=None, files=None, form_data=None):
         """Run a single API test"""
-        url = f"{self.base_url}/api/{endpoint}"
         headers = {'Content-Type': 'application/json'}
         
         if self.token:
@@ -35,15 +65,15 @@ class DoorDiscoveryAPITester:
         
         try:
             if method == 'GET':
-                response = requests.get(url, headers=headers)
+                response = self.client.get(endpoint, headers=headers)
             elif method == 'POST':
                 if files:
                     # Remove Content-Type header for multipart/form-data
                     if 'Content-Type' in headers:
                         del headers['Content-Type']
-                    response = requests.post(url, headers=headers, files=files, data=form_data)
+                    response = self.client.post(endpoint, headers=headers, files=files, data=form_data)
                 else:
-                    response = requests.post(url, json=data, headers=headers)
+                    response = self.client.post(endpoint, json=data, headers=headers)
             
             success = response.status_code == expected_status
             
@@ -88,7 +118,7 @@ class DoorDiscoveryAPITester:
         url = f"{self.base_url}/api/token"
         print(f"Login URL: {url}")
         
-        # Use requests directly for form data
+        # Post the form data directly
         form_data = {
             "username": self.user_email,
             "password": self.user_password
@@ -97,8 +127,8 @@ class DoorDiscoveryAPITester:
         print(f"Attempting login with: {self.user_email}")
         
         try:
-            response = requests.post(
-                url,
+            response = self.client.post(
+                "token",
                 data=form_data,  # Use data instead of json for form submission
                 headers={"Content-Type": "application/x-www-form-urlencoded"}
             )
@@ -127,6 +157,93 @@ class DoorDiscoveryAPITester:
             print(f"❌ Failed - Error: {str(e)}")
             return False
 
+    def seed_user(self, label, hashed_password):
+        """Insert a user directly with the given password hash, as create_test_user.py does"""
+        email = f"{label}_{uuid.uuid4().hex[:12]}@example.com"
+        self.db.users.insert_one({
+            "id": str(uuid.uuid4()),
+            "email": email,
+            "name": f"{label.title()} User",
+            "hashed_password": hashed_password,
+            "created_at": datetime.utcnow()
+        })
+        return email
+
+    def login_status(self, email, password):
+        response = self.client.post("token", data={"username": email, "password": password})
+        return response.status_code
+
+    def test_password_upgrade(self, name, label, hashed_password, password):
+        """Test that logging in with an outdated hash works and rewrites it as argon2id"""
+        if self.db is None:
+            print(f"\n⚠️ Skipping {name}: MONGO_URL not set")
+            return True
+        
+        self.tests_run += 1
+        print(f"\n🔍 Testing {name}...")
+        
+        try:
+            email = self.seed_user(label, hashed_password)
+            status = self.login_status(email, password)
+            if status != 200:
+                print(f"❌ Failed - Expected 200, got {status}")
+                return False
+            
+            stored = self.db.users.find_one({"email": email})["hashed_password"]
+            if not stored.startswith(CURRENT_ARGON2_PREFIX):
+                print(f"❌ Failed - Stored hash was not upgraded: {stored[:30]}")
+                return False
+            
+            # The rewritten hash must verify too
+            status = self.login_status(email, password)
+            if status != 200:
+                print(f"❌ Failed - Second login expected 200, got {status}")
+                return False
+            
+            self.tests_passed += 1
+            print(f"✅ Passed - Hash upgraded to {stored[:30]}...")
+            return True
+        except Exception as e:
+            print(f"❌ Failed - Error: {str(e)}")
+            return False
+
+    def test_legacy_bcrypt_login(self):
+        """Test login for a user whose bcrypt hash was written through passlib"""
+        # Longer than bcrypt's 72-byte limit; passlib hashed only the first 72 bytes
+        password = "LegacyPassword123!" * 5
+        hashed = bcrypt.hashpw(password.encode()[:72], bcrypt.gensalt(rounds=12)).decode()
+        return self.test_password_upgrade("Legacy bcrypt Login", "legacy", hashed, password)
+
+    def test_outdated_argon2_login(self):
+        """Test login for a user whose argon2id hash uses weaker parameters than the server's"""
+        password = "OutdatedPassword123!"
+        hashed = PasswordHasher(time_cost=1, memory_cost=8192, parallelism=1).hash(password)
+        return self.test_password_upgrade("Outdated argon2 Login", "outdated", hashed, password)
+
+    def test_malformed_hash_login(self):
+        """Test that a stored hash no scheme can parse rejects the login instead of erroring"""
+        if self.db is None:
+            print("\n⚠️ Skipping Malformed Hash Login: MONGO_URL not set")
+            return True
+        
+        self.tests_run += 1
+        print("\n🔍 Testing Malformed Hash Login...")
+        
+        try:
+            for hashed in ("$2b$12$truncated", "$argon2id$v=19$garbage", "not-a-hash"):
+                email = self.seed_user("malformed", hashed)
+                status = self.login_status(email, "password123")
+                if status != 401:
+                    print(f"❌ Failed - Expected 401 for {hashed!r}, got {status}")
+                    return False
+            
+            self.tests_passed += 1
+            print("✅ Passed - Status: 401")
+            return True
+        except Exception as e:
+            print(f"❌ Failed - Error: {str(e)}")
+            return False
+
     def test_get_current_user(self):
         """Test getting current user profile"""
         success, response = self.run_test(
@@ -137,13 +254,44 @@ class DoorDiscoveryAPITester:
         )
         return success
 
+    def test_rejected_token(self, name, token):
+        """Test that the API refuses a bearer token"""
+        self.tests_run += 1
+        print(f"\n🔍 Testing {name}...")
+        
+        try:
+            response = self.client.get("users/me", headers={'Authorization': f'Bearer {token}'})
+            if response.status_code == 401:
+                self.tests_passed += 1
+                print(f"✅ Passed - Status: {response.status_code}")
+                return True
+            print(f"❌ Failed - Expected 401, got {response.status_code}")
+            return False
+        except Exception as e:
+            print(f"❌ Failed - Error: {str(e)}")
+            return False
+
+    def test_tampered_token(self):
+        """Test that a token whose claims were edited after signing is refused"""
+        header, payload, signature = self.token.split('.')
+        claims = json.loads(base64.urlsafe_b64decode(payload + '=' * (-len(payload) % 4)))
+        # Keep sub pointing at a real user, so only the signature check can reject it
+        claims['exp'] += 3600
+        payload = base64.urlsafe_b64encode(json.dumps(claims).encode()).rstrip(b'=').decode()
+        return self.test_rejected_token("Tampered Token", f"{header}.{payload}.{signature}")
+
+    def test_expired_token(self):
+        """Test that a correctly signed token past its exp is refused"""
+        token = jwt.encode(
+            {"sub": self.user_email, "exp": datetime.utcnow() - timedelta(minutes=1)},
+            SECRET_KEY,
+            algorithm="HS256"
+        )
+        return self.test_rejected_token("Expired Token", token)
+
     def test_create_door(self):
         """Test creating a new door"""
-        # Create a simple test image
-        img = Image.new('RGB', (100, 100), color='red')
-        img_byte_arr = io.BytesIO()
-        img.save(img_byte_arr, format='JPEG')
-        img_byte_arr.seek(0)
+        img_byte_arr = io.BytesIO(self._RED_JPEG)
         
         url = f"{self.base_url}/api/doors"
         print(f"Create Door URL: {url}")
@@ -171,8 +319,8 @@ class DoorDiscoveryAPITester:
             self.tests_run += 1
             print(f"\n🔍 Testing Create Door...")
             
-            response = requests.post(
-                url,
+            response = self.client.post(
+                "doors",
                 headers=headers,
                 files=files,
                 data=form_data
@@ -184,6 +332,10 @@ class DoorDiscoveryAPITester:
                 response_data = response.json()
                 if 'id' in response_data:
                     self.test_door_id = response_data['id']
+                    self.test_door_image_urls = {
+                        'image': response_data.get('image_url'),
+                        'thumb': response_data.get('image_thumb_url')
+                    }
                     return True
                 else:
                     print("❌ No door ID in response")
@@ -200,6 +352,41 @@ class DoorDiscoveryAPITester:
             print(f"❌ Failed - Error: {str(e)}")
             return False
 
+    def test_get_door_image(self, variant, expected_width):
+        """Test that a door image URL serves a JPEG of the expected width"""
+        url = self.test_door_image_urls.get(variant)
+        if not url:
+            print(f"❌ Cannot test door {variant}: No URL available")
+            return False
+        
+        self.tests_run += 1
+        print(f"\n🔍 Testing Get Door {variant.title()}...")
+        
+        try:
+            # The URLs are relative to the backend root, not the /api client base
+            response = self.client.get(f"{self.base_url}{url}")
+            if response.status_code != 200:
+                print(f"❌ Failed - Expected 200, got {response.status_code}")
+                return False
+            
+            content_type = response.headers.get('content-type')
+            if content_type != 'image/jpeg':
+                print(f"❌ Failed - Expected image/jpeg, got {content_type}")
+                return False
+            
+            image = Image.open(io.BytesIO(response.content))
+            image.load()
+            if image.width != expected_width:
+                print(f"❌ Failed - Expected width {expected_width}, got {image.width}")
+                return False
+            
+            self.tests_passed += 1
+            print(f"✅ Passed - {image.format} {image.width}x{image.height}")
+            return True
+        except Exception as e:
+            print(f"❌ Failed - Error: {str(e)}")
+            return False
+
     def test_get_doors(self):
         """Test getting all doors"""
         success, response = self.run_test(
@@ -301,6 +488,14 @@ class DoorDiscoveryAPITester:
 
     def run_all_tests(self):
         """Run all API tests in sequence"""
+        try:
+            return self._run_all_tests()
+        finally:
+            self.client.close()
+            if self.mongo:
+                self.mongo.close()
+
+    def _run_all_tests(self):
         print("🚀 Starting Door Discovery API Tests")
         
         # Auth tests
@@ -315,10 +510,32 @@ class DoorDiscoveryAPITester:
         if not self.test_get_current_user():
             print("❌ Get current user failed")
         
+        if not self.test_tampered_token():
+            print("❌ Tampered token was accepted")
+        
+        if not self.test_expired_token():
+            print("❌ Expired token was accepted")
+        
+        if not self.test_legacy_bcrypt_login():
+            print("❌ Legacy bcrypt login failed")
+        
+        if not self.test_outdated_argon2_login():
+            print("❌ Outdated argon2 login failed")
+        
+        if not self.test_malformed_hash_login():
+            print("❌ Malformed hash login failed")
+        
         # Door tests
         if not self.test_create_door():
             print("❌ Create door failed")
         
+        # The 1600px upload is downscaled to 800px and a 200px thumbnail
+        if not self.test_get_door_image('image', 800):
+            print("❌ Get door image failed")
+        
+        if not self.test_get_door_image('thumb', 200):
+            print("❌ Get door thumbnail failed")
+        
         if not self.test_get_doors():
             print("❌ Get doors failed")
         
@@ -0,0 +1,44 @@
+import asyncio
+import os
+from motor.motor_asyncio import AsyncIOMotorClient
+from dotenv import load_dotenv
+
+# Environment setup
+load_dotenv('/app/backend/.env')
+
+# MongoDB connection
+mongo_url = os.environ['MONGO_URL']
+client = AsyncIOMotorClient(mongo_url)
+db = client[os.environ.get('DB_NAME', 'door_discovery_db')]
+
+# Collections that reference users by id
+USER_REFERENCES = ["doors", "comments", "notifications"]
+
+async def dedupe_users():
+    # Run before starting the backend on a database created before emails were unique;
+    # the server cannot build its unique users.email index while duplicates exist.
+    duplicates = db.users.aggregate([
+        {"$sort": {"created_at": 1}},
+        {"$group": {"_id": "$email", "ids": {"$push": "$id"}, "count": {"$sum": 1}}},
+        {"$match": {"count": {"$gt": 1}}}
+    ])
+
+    merged = 0
+    async for group in duplicates:
+        # Keep the oldest account and move everything owned by the others onto it
+        keep_id, *extra_ids = group["ids"]
+        for collection in USER_REFERENCES:
+            await db[collection].update_many(
+                {"user_id": {"$in": extra_ids}}, {"$set": {"user_id": keep_id}}
+            )
+        await db.users.delete_many({"id": {"$in": extra_ids}})
+        merged += len(extra_ids)
+        print(f"{group['_id']}: kept {keep_id}, merged {len(extra_ids)} duplicate(s)")
+
+    if merged:
+        print(f"Merged {merged} duplicate user(s). Restart the backend to build the unique indexes.")
+    else:
+        print("No duplicate users found!")
+
+# Run the async function
+asyncio.run(dedupe_users())
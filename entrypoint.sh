@@ -5,8 +5,10 @@ set -e
 cd /backend || { echo "Backend directory not found"; exit 1; }
 
 echo "Starting FastAPI backend"
-# Start Uvicorn with proper host binding
-uvicorn server:app --host 0.0.0.0 --port 8001 &
+# Start Uvicorn with proper host binding, one worker per CPU on uvloop/httptools
+uvicorn server:app --host 0.0.0.0 --port 8001 \
+    --loop uvloop --http httptools \
+    --workers "${UVICORN_WORKERS:-$(nproc)}" --limit-concurrency 1024 &
 BACKEND_PID=$!
 
 echo "Waiting for backend to start..."
@@ -14,6 +14,9 @@ mapboxgl.accessToken = 'pk.eyJ1IjoibWFwYm94IiwiYSI6ImNpejY4M29iazA2Z2gycXA4N2pmb
 const BACKEND_URL = process.env.REACT_APP_BACKEND_URL;
 const API = `${BACKEND_URL}/api`;
 
+// Door images are served by the backend; older doors still carry inline data URLs
+const imageSrc = (url) => (url && url.startsWith("/") ? `${BACKEND_URL}${url}` : url);
+
 // Auth context
 const AuthContext = React.createContext();
 
@@ -439,7 +442,7 @@ const Home = () => {
             >
               <div className="h-48 overflow-hidden">
                 <img 
-                  src={door.image_url} 
+                  src={imageSrc(door.image_thumb_url)} 
                   alt={door.title} 
                   className="w-full h-full object-cover transition transform hover:scale-105"
                 />
@@ -1347,7 +1350,7 @@ const DoorDetail = () => {
         <div className="md:flex">
           <div className="md:w-1/2">
             <img
-              src={door.image_url}
+              src={imageSrc(door.image_url)}
               alt={door.title}
               className="w-full h-auto object-cover"
             />